@@ -1,10 +1,217 @@
 import os
+import time
+import asyncio
 import logging
 import anthropic
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI
 
 logger = logging.getLogger(__name__)
 
+# 使用するClaudeのモデル
+CLAUDE_MODEL = "claude-3-haiku-20240307"
+
+# Message Batches APIによるまとめ処理の設定
+CLAUDE_BATCHING_ENABLED = os.environ.get("CLAUDE_BATCHING_ENABLED", "false").lower() == "true"
+BATCH_WINDOW = 1.0          # リクエストを溜める時間（秒）
+BATCH_MAX_SIZE = 20         # この件数に達したら待たずに送信
+BATCH_POLL_INTERVAL = 5.0   # バッチの完了を確認する間隔（秒）
+BATCH_MAX_WAIT = float(os.environ.get("CLAUDE_BATCH_MAX_WAIT", "600"))  # バッチの完了を待つ上限（秒）
+
+# 要約生成用のシステムプロンプト（リクエスト間で共通のためプロンプトキャッシュの対象にする）
+SUMMARY_SYSTEM_PROMPT = """
+あなたはSlackのスレッドを要約する専門AIアシスタントです。
+以下のSlackスレッドの内容を分析し、次の形式で簡潔に要約してください：
+
+## スレッド要約
+- **主題**: [議論の主なテーマ]
+- **参加者**: [会話に参加している人々のリスト]
+
+## 主要ポイント
+- [重要なポイントを箇条書きで、最大5つ]
+
+## 結論/次のアクション
+- [合意された事項や次のアクションがあれば記載]
+
+## 未解決の質問
+- [未解決の質問があれば記載]
+
+要約は簡潔でありながら、元のスレッドの重要な情報をすべて含むものにしてください。
+各ユーザーの発言内容を「〜さんが〜と言った」という形式で要約に含めてください。
+"""
+
+# キーワード抽出用のシステムプロンプト
+KEYWORD_SYSTEM_PROMPT = """
+以下のSlackスレッド要約から重要なキーワード（専門用語、プロジェクト名、技術名など）を最大10個抽出してください。
+キーワードはカンマ区切りのリストとして返してください。
+"""
+
+class _NoLimit:
+    """
+    同時実行数の制限が設定されていない場合に使う何もしない非同期コンテキストマネージャ
+    """
+    
+    async def __aenter__(self):
+        return None
+    
+    async def __aexit__(self, *exc_info):
+        return False
+
+_NO_LIMIT = _NoLimit()
+
+def _claude_request_params(system_prompt, content, max_tokens):
+    """
+    Claude APIのリクエストパラメータを作成する
+    システムプロンプトはプロンプトキャッシュ（cache_control）付きのブロック形式にする
+    """
+    return {
+        "model": CLAUDE_MODEL,
+        "system": [
+            {
+                "type": "text",
+                "text": system_prompt,
+                "cache_control": {"type": "ephemeral"}
+            }
+        ],
+        "max_tokens": max_tokens,
+        "messages": [
+            {"role": "user", "content": content}
+        ]
+    }
+
+class BatchingLLMClient:
+    """
+    同時に届いたClaudeへのリクエストをMessage Batches APIでまとめて処理するクラス
+    BATCH_WINDOWの間に1件しか届かなかった場合は通常のAPIで即時に処理する
+    """
+    
+    def __init__(self, claude_client, semaphore=None):
+        """
+        Parameters:
+        claude_client (anthropic.AsyncAnthropic): 使用するClaudeクライアント
+        semaphore (asyncio.Semaphore): API呼び出しの同時実行数を制限するセマフォ
+            （バッチの完了待ちの間は保持しない）
+        """
+        self.claude_client = claude_client
+        self.semaphore = semaphore
+        self._pending = []  # (システムプロンプト, 内容, 最大トークン数, Future) のリスト
+        self._tasks = set()  # 実行中の処理タスク（破棄されないよう参照を保持）
+    
+    async def submit(self, system_prompt, content, max_tokens=1000):
+        """
+        リクエストをキューに追加し、生成結果を待つ
+        
+        Returns:
+        str: 生成されたテキスト
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((system_prompt, content, max_tokens, future))
+        
+        if len(self._pending) >= BATCH_MAX_SIZE:
+            self._start_task(self._process(self._take_pending()))
+        elif len(self._pending) == 1:
+            self._start_task(self._process_after_window())
+        
+        return await future
+    
+    def _start_task(self, coro):
+        """
+        バックグラウンドで処理タスクを開始する
+        """
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    def _limit(self):
+        """
+        API呼び出しを囲む同時実行数制限のコンテキストを返す
+        """
+        return self.semaphore or _NO_LIMIT
+    
+    def _take_pending(self):
+        """
+        キューに溜まっているリクエストをすべて取り出す
+        """
+        pending, self._pending = self._pending, []
+        return pending
+    
+    async def _process_after_window(self):
+        """
+        BATCH_WINDOWだけ待ってからキューのリクエストを処理する
+        """
+        await asyncio.sleep(BATCH_WINDOW)
+        pending = self._take_pending()
+        if pending:
+            await self._process(pending)
+    
+    async def _process(self, pending):
+        """
+        取り出したリクエストを処理し、それぞれのFutureに結果を設定する
+        """
+        try:
+            if len(pending) == 1:
+                system_prompt, content, max_tokens, future = pending[0]
+                async with self._limit():
+                    response = await self.claude_client.messages.create(
+                        **_claude_request_params(system_prompt, content, max_tokens)
+                    )
+                if not future.done():
+                    future.set_result(response.content[0].text)
+            else:
+                await self._process_batch(pending)
+        except Exception as e:
+            logger.error(f"Claude APIでのエラー: {e}", exc_info=True)
+            for _, _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+    
+    async def _process_batch(self, pending):
+        """
+        Message Batches APIでまとめて生成する
+        """
+        async with self._limit():
+            batch = await self.claude_client.messages.batches.create(
+                requests=[
+                    {
+                        "custom_id": f"request-{i}",
+                        "params": _claude_request_params(system_prompt, content, max_tokens)
+                    }
+                    for i, (system_prompt, content, max_tokens, _) in enumerate(pending)
+                ]
+            )
+        logger.info(f"Message Batchを作成しました: id={batch.id}, 件数={len(pending)}")
+        
+        # バッチの処理完了を待つ（上限を超えたらキャンセルして失敗扱いにする）
+        deadline = time.monotonic() + BATCH_MAX_WAIT
+        while batch.processing_status != "ended":
+            if time.monotonic() >= deadline:
+                try:
+                    async with self._limit():
+                        await self.claude_client.messages.batches.cancel(batch.id)
+                except Exception as e:
+                    logger.warning("Message Batchのキャンセルに失敗: %s", e)
+                raise TimeoutError(f"Message Batchが{BATCH_MAX_WAIT:.0f}秒以内に完了しませんでした: id={batch.id}")
+            
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+            async with self._limit():
+                batch = await self.claude_client.messages.batches.retrieve(batch.id)
+        
+        # 結果は順不同で返るため、custom_idで対応するFutureに設定する
+        futures = {f"request-{i}": item[3] for i, item in enumerate(pending)}
+        async with self._limit():
+            async for entry in await self.claude_client.messages.batches.results(batch.id):
+                future = futures.get(entry.custom_id)
+                if future is None or future.done():
+                    continue
+                if entry.result.type == "succeeded":
+                    future.set_result(entry.result.message.content[0].text)
+                else:
+                    future.set_exception(RuntimeError(f"Message Batchのリクエストが失敗しました: {entry.result.type}"))
+        
+        # 結果に含まれなかったリクエストも待ち続けないよう失敗させる
+        for custom_id, future in futures.items():
+            if not future.done():
+                future.set_exception(RuntimeError(f"Message Batchの結果がありません: id={batch.id}, custom_id={custom_id}"))
+
 class LLMService:
     """
     LLMサービスを抽象化するクラス
@@ -30,6 +237,10 @@ class LLMService:
         # クライアントの初期化
         self.claude_client = None
         self.azure_openai_client = None
+        self.batching_client = None
+        
+        # API呼び出しの同時実行数を制限するセマフォ（set_concurrency_limitで設定）
+        self.semaphore = None
         
         # プロバイダに基づいてクライアントを初期化
         self._initialize_client()
@@ -43,15 +254,19 @@ class LLMService:
                 logger.error("ANTHROPIC_API_KEY環境変数が設定されていません")
                 raise ValueError("ANTHROPIC_API_KEY環境変数が必要です")
             
-            self.claude_client = anthropic.Anthropic(api_key=self.anthropic_api_key)
+            self.claude_client = anthropic.AsyncAnthropic(api_key=self.anthropic_api_key)
             logger.info("Claudeクライアントを初期化しました")
             
+            if CLAUDE_BATCHING_ENABLED:
+                self.batching_client = BatchingLLMClient(self.claude_client, self.semaphore)
+                logger.info("Message Batches APIによるまとめ処理を有効にしました")
+            
         elif self.provider == "azure_openai":
             if not self.azure_openai_api_key or not self.azure_openai_endpoint:
                 logger.error("Azure OpenAIの設定が不完全です")
                 raise ValueError("AZURE_OPENAI_API_KEYとAZURE_OPENAI_ENDPOINTの両方が必要です")
             
-            self.azure_openai_client = AzureOpenAI(
+            self.azure_openai_client = AsyncAzureOpenAI(
                 api_key=self.azure_openai_api_key,
                 api_version=self.azure_openai_api_version,
                 azure_endpoint=self.azure_openai_endpoint
@@ -62,6 +277,24 @@ class LLMService:
             logger.error(f"未対応のプロバイダ: {self.provider}")
             raise ValueError(f"プロバイダは'claude'または'azure_openai'のいずれかを指定してください")
     
+    def set_concurrency_limit(self, semaphore):
+        """
+        LLM APIへの同時リクエスト数を制限するセマフォを設定する
+        セマフォはAPI呼び出しの間だけ保持され、Message Batchの完了待ちの間は保持しない
+        
+        Parameters:
+        semaphore (asyncio.Semaphore): 使用するセマフォ
+        """
+        self.semaphore = semaphore
+        if self.batching_client:
+            self.batching_client.semaphore = semaphore
+    
+    def _limit(self):
+        """
+        API呼び出しを囲む同時実行数制限のコンテキストを返す
+        """
+        return self.semaphore or _NO_LIMIT
+    
     def switch_provider(self, provider):
         """
         LLMプロバイダを切り替える
@@ -81,43 +314,34 @@ class LLMService:
         
         return self.provider
     
-    def generate_summary(self, thread_text):
+    async def generate_summary(self, thread_text, on_delta=None):
         """
         スレッドの要約を生成する
         
         Parameters:
         thread_text (str): 要約するスレッドのテキスト
+        on_delta (callable): 指定した場合は応答をストリーミングし、
+            生成途中のテキスト全体を引数に呼び出す（コルーチン関数）
+            まとめ処理が有効な場合はストリーミングしない
         
         Returns:
         str: 生成された要約
         """
-        system_prompt = """
-あなたはSlackのスレッドを要約する専門AIアシスタントです。
-以下のSlackスレッドの内容を分析し、次の形式で簡潔に要約してください：
-
-## スレッド要約
-- **主題**: [議論の主なテーマ]
-- **参加者**: [会話に参加している人々のリスト]
-
-## 主要ポイント
-- [重要なポイントを箇条書きで、最大5つ]
-
-## 結論/次のアクション
-- [合意された事項や次のアクションがあれば記載]
-
-## 未解決の質問
-- [未解決の質問があれば記載]
-
-要約は簡潔でありながら、元のスレッドの重要な情報をすべて含むものにしてください。
-各ユーザーの発言内容を「〜さんが〜と言った」という形式で要約に含めてください。
-"""
+        if self.provider == "claude" and self.batching_client:
+            return await self.batching_client.submit(SUMMARY_SYSTEM_PROMPT, thread_text)
+        
+        if on_delta:
+            if self.provider == "claude":
+                return await self._stream_with_claude(SUMMARY_SYSTEM_PROMPT, thread_text, on_delta)
+            else:
+                return await self._stream_with_azure_openai(SUMMARY_SYSTEM_PROMPT, thread_text, on_delta)
         
         if self.provider == "claude":
-            return self._generate_with_claude(system_prompt, thread_text)
+            return await self._generate_with_claude(SUMMARY_SYSTEM_PROMPT, thread_text)
         else:
-            return self._generate_with_azure_openai(system_prompt, thread_text)
+            return await self._generate_with_azure_openai(SUMMARY_SYSTEM_PROMPT, thread_text)
     
-    def extract_keywords(self, summary):
+    async def extract_keywords(self, summary):
         """
         要約から重要なキーワードを抽出する
         
@@ -127,35 +351,45 @@ class LLMService:
         Returns:
         str: 抽出されたキーワード（カンマ区切り）
         """
-        system_prompt = """
-以下のSlackスレッド要約から重要なキーワード（専門用語、プロジェクト名、技術名など）を最大10個抽出してください。
-キーワードはカンマ区切りのリストとして返してください。
-"""
-        
         if self.provider == "claude":
-            return self._generate_with_claude(system_prompt, summary, max_tokens=100)
+            return await self._generate_with_claude(KEYWORD_SYSTEM_PROMPT, summary, max_tokens=100)
         else:
-            return self._generate_with_azure_openai(system_prompt, summary, max_tokens=100)
+            return await self._generate_with_azure_openai(KEYWORD_SYSTEM_PROMPT, summary, max_tokens=100)
     
-    def _generate_with_claude(self, system_prompt, content, max_tokens=1000):
+    async def _generate_with_claude(self, system_prompt, content, max_tokens=1000):
         """
         Claude APIを使用して生成する
+        システムプロンプトはプロンプトキャッシュ（cache_control）を有効にして送信する
         """
         try:
-            response = self.claude_client.messages.create(
-                model="claude-3-haiku-20240307",
-                system=system_prompt,
-                max_tokens=max_tokens,
-                messages=[
-                    {"role": "user", "content": content}
-                ]
-            )
+            async with self._limit():
+                response = await self.claude_client.messages.create(
+                    **_claude_request_params(system_prompt, content, max_tokens)
+                )
             return response.content[0].text
         except Exception as e:
             logger.error(f"Claude APIでのエラー: {e}", exc_info=True)
             raise
     
-    def _generate_with_azure_openai(self, system_prompt, content, max_tokens=1000):
+    async def _stream_with_claude(self, system_prompt, content, on_delta, max_tokens=1000):
+        """
+        Claude APIを使用してストリーミング生成する
+        """
+        try:
+            text = ""
+            async with self._limit():
+                async with self.claude_client.messages.stream(
+                    **_claude_request_params(system_prompt, content, max_tokens)
+                ) as stream:
+                    async for chunk in stream.text_stream:
+                        text += chunk
+                        await on_delta(text)
+            return text
+        except Exception as e:
+            logger.error(f"Claude APIでのエラー: {e}", exc_info=True)
+            raise
+    
+    async def _generate_with_azure_openai(self, system_prompt, content, max_tokens=1000):
         """
         Azure OpenAI APIを使用して生成する
         """
@@ -165,13 +399,44 @@ class LLMService:
                 {"role": "user", "content": content}
             ]
             
-            response = self.azure_openai_client.chat.completions.create(
-                model=self.azure_openai_deployment,
-                messages=messages,
-                max_tokens=max_tokens
-            )
+            async with self._limit():
+                response = await self.azure_openai_client.chat.completions.create(
+                    model=self.azure_openai_deployment,
+                    messages=messages,
+                    max_tokens=max_tokens
+                )
             
             return response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"Azure OpenAI APIでのエラー: {e}", exc_info=True)
+            raise
+    
+    async def _stream_with_azure_openai(self, system_prompt, content, on_delta, max_tokens=1000):
+        """
+        Azure OpenAI APIを使用してストリーミング生成する
+        """
+        try:
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": content}
+            ]
+            
+            text = ""
+            async with self._limit():
+                response = await self.azure_openai_client.chat.completions.create(
+                    model=self.azure_openai_deployment,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    stream=True
+                )
+                
+                async for chunk in response:
+                    # Azureのコンテンツフィルタ結果などchoicesが空のチャンクは読み飛ばす
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    text += chunk.choices[0].delta.content
+                    await on_delta(text)
+            return text
         except Exception as e:
             logger.error(f"Azure OpenAI APIでのエラー: {e}", exc_info=True)
             raise
\ No newline at end of file
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import numpy as np
+from openai import AsyncAzureOpenAI
+from llm_service import SUMMARY_SYSTEM_PROMPT
+
+logger = logging.getLogger(__name__)
+
+# セマンティックキャッシュの設定
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_DIR = os.environ.get("SEMANTIC_CACHE_DIR", "cache")
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95"))  # コサイン類似度
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.environ.get("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-small")
+
+# 埋め込みモデルの入力上限を考慮し、これより長いスレッドはキャッシュを使わない
+# （先頭だけを埋め込むと、返信が増えただけのスレッドにも古い要約がヒットしてしまうため）
+EMBEDDING_MAX_CHARS = 6000
+
+# システムプロンプトが変わると要約の形式が、埋め込みモデルが変わるとベクトルの意味や次元が変わるため、
+# 両方のハッシュでキャッシュを分ける
+CACHE_NAMESPACE = hashlib.sha256(
+    f"{AZURE_OPENAI_EMBEDDING_DEPLOYMENT}\n{SUMMARY_SYSTEM_PROMPT}".encode("utf-8")
+).hexdigest()[:12]
+
+class SemanticCache:
+    """
+    スレッドテキストの埋め込みベクトルで類似スレッドの要約を検索するキャッシュ
+    ほぼ同じ内容のスレッドではLLMを呼ばずに保存済みの要約を再利用する
+    """
+    
+    def __init__(self, embedding_client, cache_dir=SEMANTIC_CACHE_DIR):
+        """
+        セマンティックキャッシュの初期化（保存済みのキャッシュがあれば読み込む）
+        
+        Parameters:
+        embedding_client (AsyncAzureOpenAI): 埋め込みベクトルの計算に使用するクライアント
+        cache_dir (str): キャッシュを保存するディレクトリ
+        """
+        self.embedding_client = embedding_client
+        os.makedirs(cache_dir, exist_ok=True)
+        self.vectors_path = os.path.join(cache_dir, f"semantic_cache_{CACHE_NAMESPACE}.npy")
+        self.entries_path = os.path.join(cache_dir, f"semantic_cache_{CACHE_NAMESPACE}.json")
+        
+        # 正規化済みの埋め込みベクトル（行ごとにエントリと対応）
+        self.vectors = None
+        # 各エントリ: {"summary": 要約, "keywords": キーワード, "last_used": 最終利用時刻,
+        #              "channel_id": チャンネルID, "thread_ts": スレッドのts, "latest_ts": 最新メッセージのts}
+        self.entries = []
+        
+        # 保存を直列化するロック（Python 3.9ではイベントループに紐づくため、最初の保存時に作成する）
+        self._save_lock = None
+        
+        self._load()
+    
+    async def lookup(self, thread_text, channel_id, thread_ts, latest_ts):
+        """
+        類似スレッドの要約を検索する
+        他のチャンネルの要約は返さない（非公開チャンネルやDMの内容が公開チャンネルに漏れないようにするため）
+        同じスレッドのエントリは最新メッセージが一致する場合のみ再利用する
+        
+        Parameters:
+        thread_text (str): LLM用にフォーマットしたスレッドのテキスト
+        channel_id (str): チャンネルID
+        thread_ts (str): スレッドの親メッセージのts
+        latest_ts (str): スレッド内の最新メッセージのts
+        
+        Returns:
+        tuple: (埋め込みベクトル, 見つかったエントリ)
+            類似するエントリがなければエントリはNone
+            埋め込みに失敗した場合やスレッドが長すぎる場合は両方None
+        """
+        if len(thread_text) > EMBEDDING_MAX_CHARS:
+            logger.info(f"スレッドが長いためセマンティックキャッシュを使用しません: {len(thread_text)}文字")
+            return None, None
+        
+        try:
+            vector = await self._embed(thread_text)
+        except Exception as e:
+            logger.warning("埋め込みベクトルの計算に失敗: %s", e)
+            return None, None
+        
+        # キャッシュの検索に失敗しても要約の生成は続けられるよう、キャッシュミスとして扱う
+        try:
+            self._discard_if_incompatible(vector)
+            if self.vectors is None or not self.entries:
+                return vector, None
+            
+            # 正規化済みなので内積がコサイン類似度になる
+            similarities = self.vectors @ vector
+            
+            # 他のチャンネルの要約と、返信が追加された同じスレッドの古い要約は返さない
+            for i, entry in enumerate(self.entries):
+                if entry.get("channel_id") != channel_id:
+                    similarities[i] = -np.inf
+                elif entry.get("thread_ts") == thread_ts and entry.get("latest_ts") != latest_ts:
+                    similarities[i] = -np.inf
+            
+            best = int(np.argmax(similarities))
+            if similarities[best] < SEMANTIC_CACHE_THRESHOLD:
+                return vector, None
+            
+            logger.info(f"セマンティックキャッシュにヒット: 類似度={similarities[best]:.3f}")
+            entry = self.entries[best]
+            entry["last_used"] = time.time()
+            return vector, entry
+        except Exception as e:
+            logger.error(f"セマンティックキャッシュの検索中にエラー: {e}", exc_info=True)
+            return None, None
+    
+    async def add(self, vector, summary, keywords, channel_id, thread_ts, latest_ts):
+        """
+        要約をキャッシュに追加する（上限を超えた場合は最も使われていないエントリを削除）
+        同じスレッドの古いエントリは新しい要約で置き換える
+        
+        Parameters:
+        vector (numpy.ndarray): lookupで得た埋め込みベクトル
+        summary (str): 生成された要約
+        keywords (str): 抽出されたキーワード（未抽出なら空文字）
+        channel_id (str): チャンネルID
+        thread_ts (str): スレッドの親メッセージのts
+        latest_ts (str): 要約時点でのスレッド内の最新メッセージのts
+        """
+        entry = {
+            "summary": summary,
+            "keywords": keywords,
+            "last_used": time.time(),
+            "channel_id": channel_id,
+            "thread_ts": thread_ts,
+            "latest_ts": latest_ts
+        }
+        
+        try:
+            self._discard_if_incompatible(vector)
+            
+            stale = [
+                i for i, e in enumerate(self.entries)
+                if e.get("channel_id") == channel_id and e.get("thread_ts") == thread_ts
+            ]
+            if stale:
+                self.vectors = np.delete(self.vectors, stale, axis=0)
+                self.entries = [e for i, e in enumerate(self.entries) if i not in stale]
+            
+            if self.vectors is None:
+                self.vectors = vector[np.newaxis, :]
+            else:
+                self.vectors = np.vstack([self.vectors, vector])
+            self.entries = self.entries + [entry]
+            
+            if len(self.entries) > SEMANTIC_CACHE_MAX_ENTRIES:
+                oldest = min(range(len(self.entries)), key=lambda i: self.entries[i]["last_used"])
+                self.vectors = np.delete(self.vectors, oldest, axis=0)
+                self.entries = self.entries[:oldest] + self.entries[oldest + 1:]
+        except Exception as e:
+            logger.error(f"セマンティックキャッシュへの追加中にエラー: {e}", exc_info=True)
+            return
+        
+        # ファイル書き込みでイベントループを止めないよう別スレッドで保存
+        # 同時に保存すると一時ファイルを奪い合い、ベクトルとエントリの対応が崩れるため1件ずつ保存する
+        if self._save_lock is None:
+            self._save_lock = asyncio.Lock()
+        try:
+            async with self._save_lock:
+                await asyncio.to_thread(self._save, self.vectors, self.entries)
+        except Exception as e:
+            logger.error(f"セマンティックキャッシュの保存中にエラー: {e}", exc_info=True)
+    
+    def _discard_if_incompatible(self, vector):
+        """
+        保存済みのベクトルと次元が異なる場合（埋め込みモデルが変わった場合など）はキャッシュを破棄する
+        """
+        if self.vectors is not None and self.vectors.shape[1:] != vector.shape:
+            logger.warning(
+                f"埋め込みベクトルの次元が一致しないためセマンティックキャッシュを破棄します: "
+                f"{self.vectors.shape[1:]} != {vector.shape}"
+            )
+            self.vectors, self.entries = None, []
+    
+    async def _embed(self, text):
+        """
+        テキストの埋め込みベクトルを計算し、長さ1に正規化して返す
+        """
+        response = await self.embedding_client.embeddings.create(
+            model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
+            input=text
+        )
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+    
+    def _load(self):
+        """
+        保存済みのキャッシュを読み込む
+        """
+        if not os.path.exists(self.vectors_path) or not os.path.exists(self.entries_path):
+            return
+        
+        try:
+            vectors = np.load(self.vectors_path)
+            with open(self.entries_path, encoding="utf-8") as f:
+                entries = json.load(f)
+            
+            if len(vectors) != len(entries):
+                logger.warning("セマンティックキャッシュのファイルが不整合のため読み込みをスキップします")
+                return
+            
+            self.vectors, self.entries = vectors, entries
+            logger.info(f"セマンティックキャッシュを読み込みました: {len(entries)}件")
+        except Exception as e:
+            logger.error(f"セマンティックキャッシュの読み込み中にエラー: {e}", exc_info=True)
+    
+    def _save(self, vectors, entries):
+        """
+        キャッシュをファイルに保存する（一時ファイルに書いてから置き換える）
+        """
+        vectors_tmp = self.vectors_path + ".tmp"
+        entries_tmp = self.entries_path + ".tmp"
+        
+        with open(vectors_tmp, "wb") as f:
+            np.save(f, vectors)
+        with open(entries_tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        
+        os.replace(vectors_tmp, self.vectors_path)
+        os.replace(entries_tmp, self.entries_path)
+
+def create_semantic_cache():
+    """
+    環境変数の設定に基づいてセマンティックキャッシュを作成する
+    
+    Returns:
+    SemanticCache: 無効または設定が不完全な場合はNone
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    
+    api_key = os.environ.get("AZURE_OPENAI_API_KEY")
+    endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
+    if not api_key or not endpoint:
+        logger.warning("埋め込みに使用するAzure OpenAIの設定が不完全なため、セマンティックキャッシュは無効になります")
+        return None
+    
+    embedding_client = AsyncAzureOpenAI(
+        api_key=api_key,
+        api_version=os.environ.get("AZURE_OPENAI_API_VERSION", "2023-12-01-preview"),
+        azure_endpoint=endpoint
+    )
+    logger.info("セマンティックキャッシュを有効にしました")
+    return SemanticCache(embedding_client)
\ No newline at end of file
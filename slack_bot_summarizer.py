@@ -1,14 +1,22 @@
 import os
+import asyncio
+import io
 import logging
 import re
 import time
 import json
+from collections import OrderedDict
 from datetime import datetime
-from slack_bolt import App
-from slack_bolt.adapter.socket_mode import SocketModeHandler
-import requests
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.aiohttp import AsyncSocketModeHandler
+from slack_sdk.http_retry.builtin_async_handlers import AsyncRateLimitErrorRetryHandler
+from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk.errors import SlackApiError
+import httpx
+import orjson
 from dotenv import load_dotenv
 from llm_service import LLMService
+from semantic_cache import create_semantic_cache
 
 # 環境変数のロード
 load_dotenv()
@@ -37,17 +45,189 @@ NOTION_DATABASE_ID = os.environ.get("NOTION_DATABASE_ID")
 # 使用するLLMプロバイダー（デフォルトはclaude）
 LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "claude").lower()
 
-# ラウンドトリップタイムの記録用ディクショナリ
-request_times = {}
+# 外部サービスごとの最大同時リクエスト数（Slack Tier 3やLLMのレート制限を超えないように）
+SLACK_MAX_CONCURRENCY = 8
+NOTION_MAX_CONCURRENCY = 4
+LLM_MAX_CONCURRENCY = 16
+
+# conversations.repliesの1ページあたりの取得件数（長いスレッドでのTier 3呼び出し回数を減らす）
+SLACK_REPLIES_PAGE_LIMIT = 1000
+
+# Slack APIがレート制限（429）を返した場合の最大再試行回数
+SLACK_RATE_LIMIT_MAX_RETRIES = 5
+
+# ユーザー情報・チャンネル情報キャッシュの設定（プロセス全体で共有）
+SLACK_INFO_CACHE_SIZE = 4096
+SLACK_INFO_CACHE_TTL = 3600  # 秒
+
+# ワークスペースのユーザー一覧（users.list）の再取得間隔
+USER_DIRECTORY_REFRESH_INTERVAL = int(os.environ.get("USER_DIRECTORY_REFRESH_INTERVAL", "1800"))  # 秒
+
+# Slackのメンション形式（<@USER_ID>）と要約の主題行の正規表現（モジュール読み込み時にコンパイル）
+MENTION_RE = re.compile(r'<@([A-Z0-9]+)>')
+TITLE_RE = re.compile(r'\*\*主題\*\*:\s*(.*)')
+
+# ストリーミング中に処理中メッセージを更新する最小間隔（chat.updateのレート制限 約50回/分を考慮）
+# レート制限はワークスペース全体に掛かるため、間隔はすべてのリクエストで共有する
+STREAM_UPDATE_INTERVAL = 1.5  # 秒
+
+# Notion APIの設定（リトライ対象のステータスコードとバックオフ）
+NOTION_PAGES_URL = "https://api.notion.com/v1/pages"
+NOTION_HEADERS = {
+    "Authorization": f"Bearer {NOTION_API_KEY}",
+    "Content-Type": "application/json",
+    "Notion-Version": "2022-06-28"
+}
+NOTION_MAX_RETRIES = 3
+NOTION_RETRY_BACKOFF = 0.3  # 秒
+# ページ作成（POST）は冪等でないため、ページが作成されていないことが確実な
+# 429と、Retry-After付きの503だけを再試行する（500/502/504は作成済みの可能性がある）
+NOTION_RETRY_STATUSES = {429}
+NOTION_RETRY_AFTER_STATUSES = {503}
+# 大きなページの作成にも耐えるよう、httpxの既定値（5秒）より長く待つ
+NOTION_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
 
 # LLMサービスの初期化
 llm_service = LLMService(provider=LLM_PROVIDER)
 
+# 類似スレッドの要約を再利用するセマンティックキャッシュ（無効な場合はNone）
+semantic_cache = create_semantic_cache()
+
+# Notion API用のHTTPクライアント（keep-aliveで接続を再利用し、TLSハンドシェイクを省く）
+notion_http_client = httpx.AsyncClient(
+    headers=NOTION_HEADERS,
+    timeout=NOTION_TIMEOUT,
+    transport=httpx.AsyncHTTPTransport(
+        retries=NOTION_MAX_RETRIES,  # 接続エラー時の再試行
+        limits=httpx.Limits(max_connections=10, max_keepalive_connections=10)
+    )
+)
+
 # Bolt アプリの初期化
-app = App(token=SLACK_BOT_TOKEN)
+app = AsyncApp(token=SLACK_BOT_TOKEN)
+
+# レート制限時はRetry-Afterに従って再試行する（ハンドラに渡されるクライアントにも引き継がれる）
+app.client.retry_handlers.append(AsyncRateLimitErrorRetryHandler(max_retry_count=SLACK_RATE_LIMIT_MAX_RETRIES))
+
+# キャッシュ経由の問い合わせに使用するSlackクライアント
+_slack_client = app.client
+
+# 途中経過の更新に使用するSlackクライアント
+# 途中経過は省略しても問題ないため、レート制限時に再試行せずにスキップする（再試行の待機でLLMのストリームを止めない）
+_stream_update_client = AsyncWebClient(token=SLACK_BOT_TOKEN)
+
+# 次に途中経過を更新してよい時刻（time.monotonic()基準、全リクエストで共有）
+_next_stream_update = 0.0
+
+# 外部サービスへの同時リクエスト数を制限するセマフォ
+# （Python 3.9ではセマフォが生成時のイベントループに紐づくため、main()内で作成する）
+SLACK_SEMAPHORE = None
+NOTION_SEMAPHORE = None
+LLM_SEMAPHORE = None
+
+def init_concurrency_limits():
+    """
+    実行中のイベントループ上で外部サービスごとのセマフォを作成する
+    """
+    global SLACK_SEMAPHORE, NOTION_SEMAPHORE, LLM_SEMAPHORE
+    SLACK_SEMAPHORE = asyncio.Semaphore(SLACK_MAX_CONCURRENCY)
+    NOTION_SEMAPHORE = asyncio.Semaphore(NOTION_MAX_CONCURRENCY)
+    LLM_SEMAPHORE = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    
+    # LLMはAPI呼び出し中のみ枠を使う（Message Batchの完了待ちで枠を占有しない）
+    llm_service.set_concurrency_limit(LLM_SEMAPHORE)
+
+# users.listで一括取得したユーザー情報（ユーザーID -> ユーザー情報）
+USER_DIRECTORY = {}
+
+# IDごとの (有効期限, 情報) を保持するLRUキャッシュ
+_user_info_cache = OrderedDict()
+_conversation_info_cache = OrderedDict()
+
+def _cache_get(cache, key):
+    """
+    キャッシュから有効期限内の値を取得する（なければNone）
+    """
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    expires_at, value = entry
+    if expires_at < time.monotonic():
+        del cache[key]
+        return None
+    cache.move_to_end(key)
+    return value
+
+def _cache_put(cache, key, value):
+    """
+    キャッシュに値を保存し、上限を超えた古いエントリを削除する
+    """
+    cache[key] = (time.monotonic() + SLACK_INFO_CACHE_TTL, value)
+    cache.move_to_end(key)
+    while len(cache) > SLACK_INFO_CACHE_SIZE:
+        cache.popitem(last=False)
+
+async def refresh_user_directory():
+    """
+    users.listをページングしながら呼び出し、ワークスペースのユーザー一覧を更新する
+    """
+    global USER_DIRECTORY
+    directory = {}
+    cursor = None
+    
+    while True:
+        async with SLACK_SEMAPHORE:
+            result = await _slack_client.users_list(limit=1000, cursor=cursor)
+        for member in result["members"]:
+            directory[member["id"]] = member
+        
+        cursor = result.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            break
+    
+    USER_DIRECTORY = directory
+    logger.info(f"ユーザー一覧を更新しました: {len(directory)}人")
+
+async def refresh_user_directory_periodically():
+    """
+    一定間隔でユーザー一覧を再取得する（バックグラウンドタスク）
+    """
+    while True:
+        try:
+            await refresh_user_directory()
+        except Exception as e:
+            logger.error(f"ユーザー一覧の取得中にエラー: {e}", exc_info=True)
+        await asyncio.sleep(USER_DIRECTORY_REFRESH_INTERVAL)
+
+async def _cached_user_info(user_id):
+    """
+    ユーザー情報をユーザー一覧から取得し、なければusers_infoの結果をユーザーIDごとにキャッシュする
+    （例外は呼び出し元へ送出され、キャッシュされない）
+    """
+    user_info = USER_DIRECTORY.get(user_id)
+    if user_info is not None:
+        return user_info
+    
+    user_info = _cache_get(_user_info_cache, user_id)
+    if user_info is None:
+        async with SLACK_SEMAPHORE:
+            user_info = (await _slack_client.users_info(user=user_id))["user"]
+        _cache_put(_user_info_cache, user_id, user_info)
+    return user_info
+
+async def _cached_conversation_info(channel_id):
+    """
+    conversations_infoの結果をチャンネルIDごとにキャッシュする
+    """
+    channel_info = _cache_get(_conversation_info_cache, channel_id)
+    if channel_info is None:
+        async with SLACK_SEMAPHORE:
+            channel_info = (await _slack_client.conversations_info(channel=channel_id))["channel"]
+        _cache_put(_conversation_info_cache, channel_id, channel_info)
+    return channel_info
 
 @app.event("app_mention")
-def handle_app_mentions(body, say, client):
+async def handle_app_mentions(body, say, client):
     """
     @bot_nameメンションを処理する
     """
@@ -59,7 +239,7 @@ def handle_app_mentions(body, say, client):
     
     # リクエスト開始時間を記録
     request_id = f"{channel_id}_{thread_ts}_{int(time.time())}"
-    request_times[request_id] = time.time()
+    request_start_time = time.monotonic()
     
     logger.info(f"要約リクエストを受信: channel={channel_id}, thread={thread_ts}, user={user_id}")
     
@@ -85,51 +265,70 @@ def handle_app_mentions(body, say, client):
         if save_to_notion:
             initial_message += "\nNotionにも保存します。"
             
-        response = say(
-            text=initial_message,
-            thread_ts=thread_ts
-        )
+        async with SLACK_SEMAPHORE:
+            response = await say(
+                text=initial_message,
+                thread_ts=thread_ts
+            )
         processing_ts = response["ts"]
         
         try:
-            # スレッド内のメッセージを取得
+            # スレッド内のメッセージとチャンネル情報を並列で取得
             logger.info(f"スレッドメッセージの取得を開始: {thread_ts}")
-            thread_messages = get_thread_messages(client, channel_id, thread_ts)
+            thread_messages, channel_info = await asyncio.gather(
+                get_thread_messages(client, channel_id, thread_ts),
+                get_channel_info(channel_id)
+            )
             logger.info(f"取得したメッセージ数: {len(thread_messages)}")
-            
-            # チャンネル情報を取得
-            channel_info = get_channel_info(client, channel_id)
             channel_name = channel_info.get("name", "unknown-channel")
             
-            # LLM用にフォーマット
-            thread_text = format_messages_for_llm(client, thread_messages)
+            # スレッド内のユーザー情報をまとめて並列取得
+            user_infos = await prefetch_user_info(collect_user_ids(thread_messages))
+            
+            # LLM用にフォーマットし、参加者とメールアドレスを取得（user_idも含む）
+            thread_text, participants = build_thread_context(thread_messages, user_infos)
+            logger.info(f"スレッド参加者数: {len(participants)}")
             
             # スレッドのURLを生成
             thread_url = f"https://slack.com/archives/{channel_id}/p{thread_ts.replace('.', '')}"
             logger.info(f"スレッドURL: {thread_url}")
             
-            # 要約の生成
-            logger.info("LLMによる要約生成を開始")
-            summary_start_time = time.time()
-            summary = llm_service.generate_summary(thread_text)
-            summary_duration = time.time() - summary_start_time
-            logger.info(f"要約生成完了: 処理時間={summary_duration:.2f}秒")
+            # 類似スレッドの要約がキャッシュにあれば再利用
+            # 同じスレッドでも返信が増えていれば古い要約を使わないよう、最新メッセージのtsで区別する
+            latest_ts = max((msg["ts"] for msg in thread_messages), key=float, default=thread_ts)
+            cache_vector, cached_entry = None, None
+            if semantic_cache:
+                cache_vector, cached_entry = await semantic_cache.lookup(
+                    thread_text, channel_id, thread_ts, latest_ts
+                )
             
-            # 参加者とメールアドレスを取得（user_idも含む）
-            participants = extract_participants_with_email(thread_messages, client)
-            logger.info(f"スレッド参加者数: {len(participants)}")
+            if cached_entry:
+                summary = cached_entry["summary"]
+                keywords = cached_entry.get("keywords", "")
+            else:
+                # 要約の生成
+                logger.info("LLMによる要約生成を開始")
+                summary_start_time = time.monotonic()
+                summary = await llm_service.generate_summary(
+                    thread_text,
+                    on_delta=throttled_chat_update(channel_id, processing_ts)
+                )
+                summary_duration = time.monotonic() - summary_start_time
+                logger.info(f"要約生成完了: 処理時間={summary_duration:.2f}秒")
+                keywords = ""
             
             # Notionに保存するか判断
             notion_url = None
             if save_to_notion and NOTION_API_KEY and NOTION_DATABASE_ID:
                 try:
-                    # キーワードの抽出
-                    logger.info("重要キーワードの抽出を開始")
-                    keywords = llm_service.extract_keywords(summary)
+                    # キーワードの抽出（キャッシュにあれば省略）
+                    if not keywords:
+                        logger.info("重要キーワードの抽出を開始")
+                        keywords = await llm_service.extract_keywords(summary)
                     logger.info(f"抽出されたキーワード: {keywords}")
                     
                     # Notionに保存
-                    notion_response = save_summary_to_notion(
+                    notion_response = await save_summary_to_notion(
                         summary=summary,
                         channel_name=channel_name,
                         thread_url=thread_url,
@@ -151,30 +350,39 @@ def handle_app_mentions(body, say, client):
             if notion_url:
                 response_text += f"\n\n*<{notion_url}|📝 Notionにも保存しました>*"
             
-            # 使用したLLMプロバイダを表示
-            response_text += f"\n\n_Generated by: {llm_service.provider}_"
+            # 使用したLLMプロバイダを表示（キャッシュを再利用した場合はその旨を表示）
+            if cached_entry:
+                response_text += "\n\n_Generated by: 類似スレッドの要約キャッシュ_"
+            else:
+                response_text += f"\n\n_Generated by: {llm_service.provider}_"
             
             # 処理中メッセージを更新
-            client.chat_update(
-                channel=channel_id,
-                ts=processing_ts,
-                text=response_text
-            )
+            async with SLACK_SEMAPHORE:
+                await client.chat_update(
+                    channel=channel_id,
+                    ts=processing_ts,
+                    text=response_text
+                )
             
-            # 処理時間の記録
-            if request_id in request_times:
-                total_duration = time.time() - request_times[request_id]
-                logger.info(f"要約処理完了: リクエストID={request_id}, 合計処理時間={total_duration:.2f}秒")
-                del request_times[request_id]
+            # 新しく生成した要約をキャッシュに追加（ファイルへの保存で返信を待たせないよう、返信後に行う）
+            if semantic_cache and cache_vector is not None and not cached_entry:
+                await semantic_cache.add(
+                    cache_vector, summary, keywords, channel_id, thread_ts, latest_ts
+                )
             
         except Exception as e:
             logger.error(f"Error processing thread: {e}", exc_info=True)
             # エラーメッセージを送信
-            client.chat_update(
-                channel=channel_id,
-                ts=processing_ts,
-                text=f"スレッドの要約中にエラーが発生しました: {str(e)}"
-            )
+            async with SLACK_SEMAPHORE:
+                await client.chat_update(
+                    channel=channel_id,
+                    ts=processing_ts,
+                    text=f"スレッドの要約中にエラーが発生しました: {str(e)}"
+                )
+        finally:
+            # 処理時間の記録（エラー時も含む）
+            total_duration = time.monotonic() - request_start_time
+            logger.info(f"要約処理完了: リクエストID={request_id}, 合計処理時間={total_duration:.2f}秒")
     else:
         # スレッド外でのメンションの場合
         response_text = "スレッド内で @呼び出してください。スレッドの内容を要約します。\n"
@@ -184,33 +392,86 @@ def handle_app_mentions(body, say, client):
         response_text += "- `@summary_bot use_azure` - Azure OpenAIを使用\n"
         response_text += f"\n現在のLLMプロバイダ: *{llm_service.provider}*"
         
-        say(response_text)
+        async with SLACK_SEMAPHORE:
+            await say(response_text)
         logger.info("スレッド外でのメンションを検出: 処理をスキップします")
 
+def throttled_chat_update(channel_id, ts):
+    """
+    生成途中の要約で処理中メッセージを更新するコールバックを返す
+    更新は全リクエスト合わせてSTREAM_UPDATE_INTERVALごとに間引き、レート制限中はスキップする
+    """
+    async def on_delta(text):
+        global _next_stream_update
+        now = time.monotonic()
+        if now < _next_stream_update:
+            return
+        _next_stream_update = now + STREAM_UPDATE_INTERVAL
+        
+        try:
+            async with SLACK_SEMAPHORE:
+                await _stream_update_client.chat_update(
+                    channel=channel_id,
+                    ts=ts,
+                    text=f"{text}\n\n_要約を生成しています..._"
+                )
+        except SlackApiError as e:
+            if e.response.status_code == 429:
+                # Retry-Afterの間はどのリクエストも途中経過を更新しない
+                retry_after = float(e.response.headers.get("Retry-After", STREAM_UPDATE_INTERVAL))
+                _next_stream_update = max(_next_stream_update, time.monotonic() + retry_after)
+                logger.info("途中経過の更新がレート制限されたためスキップします: Retry-After=%s秒", retry_after)
+            else:
+                logger.warning("途中経過の更新に失敗: %s", e)
+        except Exception as e:
+            # 途中経過の更新に失敗しても要約の生成は継続する
+            logger.warning("途中経過の更新に失敗: %s", e)
+    
+    return on_delta
+
 # 以下の関数は従来のまま
-def get_thread_messages(client, channel_id, thread_ts):
+async def get_thread_messages(client, channel_id, thread_ts):
     """
-    スレッド内のメッセージを取得する
+    スレッド内のメッセージを取得する（長いスレッドはページングしてすべて取得）
     """
     try:
-        result = client.conversations_replies(
-            channel=channel_id,
-            ts=thread_ts
-        )
-        return result["messages"]
+        messages = []
+        seen_ts = set()
+        cursor = None
+        
+        while True:
+            async with SLACK_SEMAPHORE:
+                result = await client.conversations_replies(
+                    channel=channel_id,
+                    ts=thread_ts,
+                    cursor=cursor,
+                    limit=SLACK_REPLIES_PAGE_LIMIT
+                )
+            # 親メッセージは各ページの先頭に含まれるため、tsで重複を除く
+            for msg in result["messages"]:
+                if msg["ts"] not in seen_ts:
+                    seen_ts.add(msg["ts"])
+                    messages.append(msg)
+            
+            if not result.get("has_more"):
+                break
+            cursor = result.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                break
+        
+        return messages
     except Exception as e:
         logger.error(f"Error fetching thread messages: {e}", exc_info=True)
         raise e
 
-def get_channel_info(client, channel_id):
+async def get_channel_info(channel_id):
     """
     チャンネル情報を取得する
     """
     try:
         # チャンネルIDがCから始まる場合は標準的なパブリックチャンネル
         if channel_id.startswith('C'):
-            result = client.conversations_info(channel=channel_id)
-            return result["channel"]
+            return await _cached_conversation_info(channel_id)
         # Dから始まる場合はDM
         elif channel_id.startswith('D'):
             return {"name": "direct-message", "is_dm": True}
@@ -225,12 +486,53 @@ def get_channel_info(client, channel_id):
         # エラーが発生しても最低限の情報を返す
         return {"name": f"channel-{channel_id}", "error": str(e)}
 
-def format_messages_for_llm(client, messages):
+def collect_user_ids(messages):
     """
-    LLM用にメッセージをフォーマットする
+    スレッドメッセージから投稿者とメンションされたユーザーのIDを収集する
     """
-    formatted_messages = []
-    user_cache = {}  # ユーザー情報のキャッシュ
+    user_ids = set()
+    
+    for msg in messages:
+        user_id = msg.get("user")
+        # ボット自身のメッセージはスキップ
+        if user_id and not msg.get("bot_id"):
+            user_ids.add(user_id)
+        
+        # メンションされたユーザーも対象にする
+        user_ids.update(MENTION_RE.findall(msg.get("text", "")))
+    
+    return user_ids
+
+async def prefetch_user_info(user_ids):
+    """
+    複数ユーザーの情報をasyncio.gatherで並列に取得する
+    キャッシュ済みのユーザーはAPIを呼ばず、取得に失敗したユーザーは結果に含めない
+    """
+    user_infos = {}
+    if not user_ids:
+        return user_infos
+    
+    # 同時実行数は_cached_user_info内のSLACK_SEMAPHOREで制限される
+    user_ids = list(user_ids)
+    results = await asyncio.gather(*(_cached_user_info(user_id) for user_id in user_ids), return_exceptions=True)
+    
+    for user_id, result in zip(user_ids, results):
+        if isinstance(result, Exception):
+            # 429の多発時などに大量に出力されるため、スタックトレースは付けず遅延フォーマットする
+            logger.warning("ユーザー情報の取得に失敗: %s, エラー: %s", user_id, result)
+        else:
+            user_infos[user_id] = result
+    
+    return user_infos
+
+def build_thread_context(messages, user_infos):
+    """
+    スレッドメッセージを1回走査し、LLM用にフォーマットしたテキストと参加者情報を作成する
+    参加者にはuser_idも含める（要約者の除外に使用）
+    """
+    formatted = io.StringIO()  # フォーマット済みテキストのバッファ
+    participants = []  # 参加者情報のリスト
+    processed_users = set()  # 処理済みユーザーID
     
     for msg in messages:
         user_id = msg.get("user")
@@ -238,101 +540,56 @@ def format_messages_for_llm(client, messages):
         if not user_id or msg.get("bot_id"):
             continue
             
-        # ユーザー情報の取得（キャッシュから、なければAPIから）
-        if user_id in user_cache:
-            user_info = user_cache[user_id]
-        else:
-            try:
-                user_info = client.users_info(user=user_id)["user"]
-                user_cache[user_id] = user_info
-            except Exception as e:
-                logger.warning(f"ユーザー情報の取得に失敗: {user_id}, エラー: {e}")
-                user_info = {"real_name": f"User {user_id}"}
+        # ユーザー情報の取得（事前取得済みの情報から）
+        user_info = user_infos.get(user_id, {"real_name": f"User {user_id}", "profile": {}})
         
         username = user_info.get("real_name", f"User {user_id}")
         
+        # 初めて登場したユーザーを参加者に追加（発言が空でも参加者とする）
+        if user_id not in processed_users:
+            processed_users.add(user_id)
+            participants.append({
+                "user_id": user_id,
+                "name": username,
+                "email": user_info.get("profile", {}).get("email", "")
+            })
+        
         # メッセージテキスト（メンションを処理）
         text = msg.get("text", "")
-        text = process_mentions(text, client)
+        text = process_mentions(text, user_infos)
         
         # @botへのメンションを削除（要約対象から除外）
-        text = re.sub(r'<@[A-Z0-9]+>', '', text).strip()
+        text = MENTION_RE.sub('', text).strip()
         
         # 空のメッセージはスキップ
         if not text:
             continue
-            
-        # タイムスタンプの処理
-        ts = msg.get("ts", "unknown_time")
         
-        formatted_messages.append(f"{username}: {text}")
+        # メッセージ間は空行で区切る
+        if formatted.tell():
+            formatted.write("\n\n")
+        formatted.write(username)
+        formatted.write(": ")
+        formatted.write(text)
     
-    return "\n\n".join(formatted_messages)
+    return formatted.getvalue(), participants
 
-def process_mentions(text, client):
+def process_mentions(text, user_infos):
     """
     テキスト内のSlackのメンション形式（<@USER_ID>）をユーザー名に置換
     """
-    mention_pattern = r'<@([A-Z0-9]+)>'
-    mentions = re.findall(mention_pattern, text)
+    mentions = MENTION_RE.findall(text)
     
     for user_id in mentions:
-        try:
-            user_info = client.users_info(user=user_id)
-            user_name = user_info["user"]["real_name"]
-            text = text.replace(f"<@{user_id}>", f"@{user_name}")
-        except Exception as e:
-            logger.warning(f"メンション処理中にエラー: {user_id}, エラー: {e}")
-            # ユーザー情報の取得に失敗した場合はそのまま
-            pass
-    
-    return text
-
-def extract_participants_with_email(messages, client):
-    """
-    スレッドメッセージから参加者とそのメールアドレスを抽出する
-    user_idも含めて返す（要約者の除外に使用）
-    """
-    participants = []  # 参加者情報のリスト
-    user_cache = {}    # ユーザー情報のキャッシュ
-    processed_users = set()  # 処理済みユーザーID
-    
-    for msg in messages:
-        user_id = msg.get("user")
-        # ボット自身のメッセージはスキップ
-        if not user_id or msg.get("bot_id"):
+        user_info = user_infos.get(user_id)
+        # ユーザー情報の取得に失敗した場合はそのまま
+        if not user_info or "real_name" not in user_info:
             continue
-            
-        # すでに処理済みのユーザーはスキップ
-        if user_id in processed_users:
-            continue
-            
-        processed_users.add(user_id)
-            
-        # ユーザー情報の取得（キャッシュから、なければAPIから）
-        if user_id in user_cache:
-            user_info = user_cache[user_id]
-        else:
-            try:
-                user_info = client.users_info(user=user_id)["user"]
-                user_cache[user_id] = user_info
-            except Exception as e:
-                logger.warning(f"ユーザー情報の取得に失敗: {user_id}, エラー: {e}")
-                user_info = {"real_name": f"User {user_id}", "profile": {}}
-        
-        username = user_info.get("real_name", f"User {user_id}")
-        email = user_info.get("profile", {}).get("email", "")
-        
-        # ユーザー情報を追加（user_idも含める）
-        participants.append({
-            "user_id": user_id,
-            "name": username,
-            "email": email
-        })
+        text = text.replace(f"<@{user_id}>", f"@{user_info['real_name']}")
     
-    return participants
+    return text
 
-def save_summary_to_notion(summary, channel_name, thread_url, thread_ts, keywords="", participants=None):
+async def save_summary_to_notion(summary, channel_name, thread_url, thread_ts, keywords="", participants=None):
     """
     要約をNotionデータベースに保存する
     参加者のメールアドレスをリッチテキストとして保存する（APIの制限により）
@@ -341,14 +598,8 @@ def save_summary_to_notion(summary, channel_name, thread_url, thread_ts, keyword
         logger.error("Notion API KeyまたはDatabase IDが設定されていません")
         return None
     
-    headers = {
-        "Authorization": f"Bearer {NOTION_API_KEY}",
-        "Content-Type": "application/json",
-        "Notion-Version": "2022-06-28"
-    }
-    
-    # 現在の日時を取得
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # 現在の日付を取得（YYYY-MM-DD形式）
+    now_date = datetime.now().strftime("%Y-%m-%d")
     
     # スレッドのタイムスタンプから日時を解析
     thread_time = datetime.fromtimestamp(float(thread_ts)).strftime("%Y-%m-%d")
@@ -361,7 +612,7 @@ def save_summary_to_notion(summary, channel_name, thread_url, thread_ts, keyword
     title = "Slack スレッド要約"
     for line in summary.split("\n"):
         if "**主題**:" in line:
-            title_match = re.search(r'\*\*主題\*\*:\s*(.*)', line)
+            title_match = TITLE_RE.search(line)
             if title_match:
                 title = title_match.group(1).strip()
                 break
@@ -388,7 +639,7 @@ def save_summary_to_notion(summary, channel_name, thread_url, thread_ts, keyword
         },
         "保存日時": {
             "date": {
-                "start": now.split()[0]  # YYYY-MM-DD形式
+                "start": now_date
             }
         },
         "スレッド日時": {
@@ -413,22 +664,25 @@ def save_summary_to_notion(summary, channel_name, thread_url, thread_ts, keyword
             ]
         }
     
-    # 参加者情報が提供されている場合 - リッチテキストとして保存
+    # 参加者情報が提供されている場合 - メールアドレスはリッチテキスト、名前はマルチセレクトとして保存
     if participants and isinstance(participants, list):
         try:
-            # 参加者のメールアドレスをリストとして整形
-            participant_emails = []
+            participant_emails = []  # 参加者のメールアドレスのリスト
+            participant_names = []   # Notionのマルチセレクトオプション形式の参加者名
             
             for person in participants:
-                if person.get("email"):
-                    name = person.get("name", "Unknown")
-                    email = person.get("email")
-                    participant_emails.append(f"{name} ({email})")
+                name = person.get("name", "")
+                email = person.get("email", "")
+                
+                if email:
+                    participant_emails.append(f"{person.get('name', 'Unknown')} ({email})")
+                if name:
+                    participant_names.append({"name": name[:100]})  # 100文字を超えないようにする
             
             # 参加者リストが空でなければプロパティに追加（リッチテキストとして）
             if participant_emails:
                 logger.info(f"参加者情報を保存: {len(participant_emails)}人")
-                # カンマと改行で区切ったテキストにする
+                # カンマで区切ったテキストにする
                 participant_text = ", ".join(participant_emails)
                 
                 properties["参加者情報"] = {
@@ -442,27 +696,13 @@ def save_summary_to_notion(summary, channel_name, thread_url, thread_ts, keyword
                 }
             else:
                 logger.warning("有効なメールアドレスを持つ参加者はいませんでした")
-        except Exception as e:
-            logger.error(f"参加者情報の処理中にエラー: {e}")
-    
-    # 参加者のタグもMultiSelectとして追加
-    if participants and isinstance(participants, list):
-        try:
-            # 参加者の名前をマルチセレクトとして追加
-            participant_names = []
-            
-            for person in participants:
-                name = person.get("name", "")
-                if name and len(name) > 0:
-                    # Notionのマルチセレクトオプション形式に変換
-                    participant_names.append({"name": name[:100]})  # 100文字を超えないようにする
             
             if participant_names:
                 properties["参加者"] = {
                     "multi_select": participant_names[:100]  # 最大100個までのオプション
                 }
         except Exception as e:
-            logger.error(f"参加者タグの処理中にエラー: {e}")
+            logger.error(f"参加者情報の処理中にエラー: {e}")
     
     data = {
         "parent": { "database_id": NOTION_DATABASE_ID },
@@ -507,11 +747,7 @@ def save_summary_to_notion(summary, channel_name, thread_url, thread_ts, keyword
     data["children"].extend(blocks)
     
     try:
-        response = requests.post(
-            "https://api.notion.com/v1/pages",
-            headers=headers,
-            json=data
-        )
+        response = await post_to_notion(data)
         
         if response.status_code == 200:
             return response.json()
@@ -522,122 +758,109 @@ def save_summary_to_notion(summary, channel_name, thread_url, thread_ts, keyword
         logger.error(f"Notion保存中のエラー: {e}", exc_info=True)
         return None
 
+async def post_to_notion(data):
+    """
+    Notionにページ作成リクエストを送信する
+    レート制限（429）とRetry-After付きの503の場合のみバックオフしながら再試行する
+    """
+    # ブロック数の多いペイロードを高速にシリアライズ（再試行時も使い回す）
+    payload = orjson.dumps(data)
+    
+    for attempt in range(NOTION_MAX_RETRIES + 1):
+        async with NOTION_SEMAPHORE:
+            response = await notion_http_client.post(NOTION_PAGES_URL, content=payload)
+        
+        retry_after = response.headers.get("Retry-After")
+        retryable = (
+            response.status_code in NOTION_RETRY_STATUSES
+            or (response.status_code in NOTION_RETRY_AFTER_STATUSES and retry_after)
+        )
+        if not retryable or attempt == NOTION_MAX_RETRIES:
+            return response
+        
+        # Retry-Afterヘッダー（秒数）があればそれに従う
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = NOTION_RETRY_BACKOFF * (2 ** attempt)
+        logger.warning(f"Notion APIの再試行: status={response.status_code}, {delay:.1f}秒後")
+        await asyncio.sleep(delay)
+
+def _notion_text_block(block_type, content):
+    """
+    テキストを1つだけ持つNotionブロック（段落・見出し・箇条書き）を作成する
+    """
+    return {
+        "object": "block",
+        "type": block_type,
+        block_type: {
+            "rich_text": [{"type": "text", "text": {"content": content}}]
+        }
+    }
+
 def convert_summary_to_notion_blocks(summary):
     """
     要約テキストをNotionのブロック形式に変換する
     """
     blocks = []
-    current_heading = None
     bullet_points = []
     
+    def flush_bullets():
+        # 溜まっている箇条書きをブロックとして追加
+        blocks.extend(_notion_text_block("bulleted_list_item", point) for point in bullet_points)
+        bullet_points.clear()
+    
     for line in summary.split("\n"):
+        stripped = line.strip()
+        
         # 見出し行の処理
         if line.startswith("##"):
-            # 前のセクションのリストがあれば追加
-            if bullet_points:
-                blocks.append({
-                    "object": "block",
-                    "type": "bulleted_list_item",
-                    "bulleted_list_item": {
-                        "rich_text": [{"type": "text", "text": {"content": bullet_points[0]}}]
-                    }
-                })
-                
-                for point in bullet_points[1:]:
-                    blocks.append({
-                        "object": "block",
-                        "type": "bulleted_list_item",
-                        "bulleted_list_item": {
-                            "rich_text": [{"type": "text", "text": {"content": point}}]
-                        }
-                    })
-                bullet_points = []
-            
-            # 見出しを追加
-            heading_text = line.strip('# ').strip()
-            blocks.append({
-                "object": "block",
-                "type": "heading_2",
-                "heading_2": {
-                    "rich_text": [{"type": "text", "text": {"content": heading_text}}]
-                }
-            })
-            current_heading = heading_text
+            flush_bullets()
+            blocks.append(_notion_text_block("heading_2", line.strip('# ').strip()))
         
         # 箇条書きの処理
-        elif line.strip().startswith("- "):
-            bullet_text = line.strip()[2:].strip()
-            bullet_points.append(bullet_text)
+        elif stripped.startswith("- "):
+            bullet_points.append(stripped[2:].strip())
         
         # 空行の処理
-        elif line.strip() == "":
-            # 前のセクションのリストがあれば追加
-            if bullet_points:
-                blocks.append({
-                    "object": "block",
-                    "type": "bulleted_list_item",
-                    "bulleted_list_item": {
-                        "rich_text": [{"type": "text", "text": {"content": bullet_points[0]}}]
-                    }
-                })
-                
-                for point in bullet_points[1:]:
-                    blocks.append({
-                        "object": "block",
-                        "type": "bulleted_list_item",
-                        "bulleted_list_item": {
-                            "rich_text": [{"type": "text", "text": {"content": point}}]
-                        }
-                    })
-                bullet_points = []
-            
-            blocks.append({
-                "object": "block",
-                "type": "paragraph",
-                "paragraph": {
-                    "rich_text": [{"type": "text", "text": {"content": ""}}]
-                }
-            })
+        elif stripped == "":
+            flush_bullets()
+            blocks.append(_notion_text_block("paragraph", ""))
         
-        # 通常のテキスト行の処理
-        else:
-            # 箇条書きの途中でなければ、段落として追加
-            if not line.strip().startswith("-") and not bullet_points:
-                blocks.append({
-                    "object": "block",
-                    "type": "paragraph",
-                    "paragraph": {
-                        "rich_text": [{"type": "text", "text": {"content": line.strip()}}]
-                    }
-                })
+        # 通常のテキスト行の処理（箇条書きの途中でなければ、段落として追加）
+        elif not stripped.startswith("-") and not bullet_points:
+            blocks.append(_notion_text_block("paragraph", stripped))
     
     # 最後のリストが残っていれば追加
-    if bullet_points:
-        blocks.append({
-            "object": "block",
-            "type": "bulleted_list_item",
-            "bulleted_list_item": {
-                "rich_text": [{"type": "text", "text": {"content": bullet_points[0]}}]
-            }
-        })
-        
-        for point in bullet_points[1:]:
-            blocks.append({
-                "object": "block",
-                "type": "bulleted_list_item",
-                "bulleted_list_item": {
-                    "rich_text": [{"type": "text", "text": {"content": point}}]
-                }
-            })
+    flush_bullets()
     
     return blocks
 
 @app.event("message")
-def handle_message_events(body, logger):
+async def handle_message_events(body, logger):
     """
-    デバッグ用: メッセージイベントをログに記録
+    メッセージイベントの受信確認のみを行う（要約にはapp_mentionだけを使用）
+    message.* を購読していなければ呼ばれない。DEBUG有効時のみ内容をログに記録する
     """
-    logger.debug(f"Message event received: {body}")
+    # DEBUG無効時はイベント全体の文字列化を行わない
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Message event received: %s", body)
+
+async def main():
+    """
+    Socket Mode ハンドラを起動し、イベントループ上でイベントを処理する
+    """
+    init_concurrency_limits()
+    
+    # ユーザー一覧をバックグラウンドで定期的に取得（参照はタスクが破棄されないよう保持）
+    directory_task = asyncio.create_task(refresh_user_directory_periodically())
+    
+    handler = AsyncSocketModeHandler(app, SLACK_APP_TOKEN)
+    logger.info(f"⚡️ Bolt アプリを起動しました！(LLM プロバイダ: {LLM_PROVIDER})")
+    try:
+        await handler.start_async()
+    finally:
+        await notion_http_client.aclose()
 
 if __name__ == "__main__":
     # Socket Mode でアプリを起動
@@ -662,8 +885,6 @@ if __name__ == "__main__":
     
     # アプリケーションの起動
     try:
-        handler = SocketModeHandler(app, SLACK_APP_TOKEN)
-        logger.info(f"⚡️ Bolt アプリを起動しました！(LLM プロバイダ: {LLM_PROVIDER})")
-        handler.start()
+        asyncio.run(main())
     except Exception as e:
         logger.critical(f"アプリの起動に失敗しました: {e}", exc_info=True)
\ No newline at end of file